@@ -9,6 +9,6 @@ from .instrumenter import DISABLE
 from .trigger import when
 from .util import clear_all, get_source_hash
 from .builder import instrument, InstrumentBuilder
-from .profiler import profile_instrumentation, PerformanceReport, get_performance_stats
+from .profiler import profile_instrumentation, PerformanceReport, get_performance_stats, is_profiling_active
 
-__all__ = ["bp", "clear_all", "do", "get_source_hash", "goto", "when", "DISABLE", "instrument", "InstrumentBuilder", "profile_instrumentation", "PerformanceReport", "get_performance_stats"]
+__all__ = ["bp", "clear_all", "do", "get_source_hash", "goto", "when", "DISABLE", "instrument", "InstrumentBuilder", "profile_instrumentation", "PerformanceReport", "get_performance_stats", "is_profiling_active"]
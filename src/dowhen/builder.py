@@ -15,6 +15,8 @@ if TYPE_CHECKING:  # pragma: no cover
     from types import TracebackType
 
 class InstrumentBuilder:
+    __slots__ = ("entity", "identifiers", "condition", "source_hash", "actions")
+
     def __init__(self, entity: Union[CodeType, FunctionType, MethodType, 
                                    ModuleType, type, None] = None):
         self.entity = entity
@@ -78,15 +80,7 @@ class InstrumentBuilder:
         if not self.actions:
             raise ValueError("At least one action must be specified (execute, breakpoint, or jump_to).")
             
-        handler = EventHandler(trigger, self.actions[0])
-        for action in self.actions[1:]:
-            if hasattr(action, 'func') and isinstance(action.func, str) and action.func == "goto":
-                handler.goto(action.kwargs["target"])
-            elif hasattr(action, 'func') and action.func == Callback.bp().func:
-                handler.bp()
-            else:
-                handler.do(action.func)
-                
+        handler = EventHandler(trigger, self.actions)
         handler.submit()
         return handler
         
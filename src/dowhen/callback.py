@@ -10,10 +10,10 @@ import sys
 import warnings
 from collections.abc import Callable
 from types import CodeType, FrameType, FunctionType, MethodType, ModuleType
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Literal
 
 from .types import IdentifierType
-from .util import call_in_frame, get_line_numbers
+from .util import compile_frame_invoker, get_line_numbers
 
 if TYPE_CHECKING:  # pragma: no cover
     from .handler import EventHandler
@@ -30,22 +30,27 @@ else:
 
 
 class Callback:
-    def __init__(self, func: str | Callable, **kwargs):
-        if isinstance(func, str):
-            pass
-        elif inspect.isfunction(func):
-            self.func_args = inspect.getfullargspec(func).args
-        elif inspect.ismethod(func):
-            self.func_args = inspect.getfullargspec(func).args
-        else:
+    def __init__(
+        self,
+        func: str | Callable,
+        *,
+        kind: Literal["do", "bp", "goto"] = "do",
+        **kwargs,
+    ):
+        if not (
+            isinstance(func, str) or inspect.isfunction(func) or inspect.ismethod(func)
+        ):
             raise TypeError(f"Unsupported callback type: {type(func)}. ")
         self.func = func
+        self.kind = kind
         self.kwargs = kwargs
+        # The arguments of a function callback are resolved once, not per event
+        self._invoker = None if isinstance(func, str) else compile_frame_invoker(func)
 
     def __call__(self, frame: FrameType, **kwargs) -> Any:
         ret = None
         if isinstance(self.func, str):
-            if self.func == "goto":  # pragma: no cover
+            if self.kind == "goto":  # pragma: no cover
                 self._call_goto(frame)
             else:
                 self._call_code(frame)
@@ -65,8 +70,8 @@ class Callback:
         exec(self.func, frame.f_globals, frame.f_locals)
 
     def _call_function(self, frame: FrameType, **kwargs) -> Any:
-        assert isinstance(self.func, (FunctionType, MethodType))
-        writeback = call_in_frame(self.func, frame, **kwargs)
+        assert self._invoker is not None
+        writeback = self._invoker(frame, kwargs)
 
         f_locals = frame.f_locals
         if isinstance(writeback, dict):
@@ -119,7 +124,7 @@ class Callback:
 
     @classmethod
     def goto(cls, target: str | int) -> Callback:
-        return cls("goto", target=target)
+        return cls("goto", kind="goto", target=target)
 
     @classmethod
     def bp(cls) -> Callback:
@@ -136,7 +141,7 @@ class Callback:
             else:
                 p.user_line(_frame)
 
-        return cls(do_breakpoint)
+        return cls(do_breakpoint, kind="bp")
 
     def when(
         self,
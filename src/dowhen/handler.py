@@ -11,15 +11,18 @@ from typing import Any, Callable
 from .callback import Callback
 from .instrumenter import Instrumenter
 from .trigger import Trigger
-from .profiler import PerformanceProfiler
+from .profiler import PerformanceProfiler, is_profiling_active
 
 DISABLE = sys.monitoring.DISABLE
 
 
 class EventHandler:
-    def __init__(self, trigger: Trigger, callback: Callback):
+    def __init__(self, trigger: Trigger, callback: Callback | list[Callback]):
         self.trigger = trigger
-        self.callbacks: list[Callback] = [callback]
+        if isinstance(callback, list):
+            self.callbacks: list[Callback] = list(callback)
+        else:
+            self.callbacks = [callback]
         self.disabled = False
         self.removed = False
 
@@ -36,7 +39,8 @@ class EventHandler:
             Instrumenter().restart_events()
 
     def submit(self) -> None:
-        PerformanceProfiler().register_handler(self)
+        if is_profiling_active():
+            PerformanceProfiler().register_handler(self)
         Instrumenter().submit(self)
 
     def remove(self) -> None:
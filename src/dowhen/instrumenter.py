@@ -5,14 +5,25 @@ from __future__ import annotations
 
 import sys
 from collections import defaultdict
+from collections.abc import Generator, Sequence
+from contextlib import contextmanager
 from types import CodeType, FrameType
 from typing import TYPE_CHECKING
 
+from .util import iter_code_objects
+
 if TYPE_CHECKING:  # pragma: no cover
     from .handler import EventHandler
 
 E = sys.monitoring.events
 DISABLE = sys.monitoring.DISABLE
+_getframe = sys._getframe
+
+_EVENT_MASKS = {
+    "line": E.LINE,
+    "start": E.PY_START,
+    "return": E.PY_RETURN,
+}
 
 
 class Instrumenter:
@@ -26,10 +37,37 @@ class Instrumenter:
     def __init__(self, tool_id: int = 4):
         if not self._initialized:
             self.tool_id = tool_id
-            self.handlers: defaultdict[CodeType | None, dict] = defaultdict(dict)
+            # Handlers are stored flat, keyed by (code, event_type, line_number),
+            # so the callbacks only need a single dict lookup per bucket. Each
+            # bucket is an insertion ordered set of handlers (a dict with None
+            # values) for O(1) removal
+            self.handlers: dict[
+                tuple[CodeType | None, str, int | None], dict[EventHandler, None]
+            ] = {}
+            # Number of buckets per code and event type, so removal can tell
+            # whether a code or an event type still has handlers in O(1)
+            self._bucket_counts: dict[CodeType | None, dict[str, int]] = {}
+            # Shadow copy of the events we set for each code, so updating them
+            # does not need a get_(local_)events round trip
+            self._event_mask: defaultdict[CodeType | None, int] = defaultdict(int)
+            # Immutable snapshots of the buckets for the callbacks. The per-code
+            # line tables are replaced, never mutated, on every change
+            self._line_dispatch: dict[
+                CodeType | None, dict[int | None, tuple[EventHandler, ...]]
+            ] = {}
+            self._start_dispatch: dict[CodeType | None, tuple[EventHandler, ...]] = {}
+            self._return_dispatch: dict[CodeType | None, tuple[EventHandler, ...]] = {}
+            # restart_events() is deferred while inside batch()
+            self._batch_depth = 0
+            self._dirty = 0
 
             sys.monitoring.use_tool_id(self.tool_id, "dowhen instrumenter")
-            sys.monitoring.register_callback(self.tool_id, E.LINE, self.line_callback)
+            # LINE events go to _local_line_callback until a global (code is
+            # None) line handler is registered
+            self._has_global_line = False
+            sys.monitoring.register_callback(
+                self.tool_id, E.LINE, self._local_line_callback
+            )
             sys.monitoring.register_callback(
                 self.tool_id, E.PY_RETURN, self.return_callback
             )
@@ -39,12 +77,18 @@ class Instrumenter:
             self._initialized = True
 
     def clear_all(self) -> None:
-        for code in self.handlers:
+        for code in self._bucket_counts:
             if code is None:
                 sys.monitoring.set_events(self.tool_id, E.NO_EVENTS)
             else:
                 sys.monitoring.set_local_events(self.tool_id, code, E.NO_EVENTS)
         self.handlers.clear()
+        self._bucket_counts.clear()
+        self._event_mask.clear()
+        self._line_dispatch.clear()
+        self._start_dispatch.clear()
+        self._return_dispatch.clear()
+        self._update_line_callback()
 
     def submit(self, event_handler: "EventHandler") -> None:
         trigger = event_handler.trigger
@@ -52,14 +96,8 @@ class Instrumenter:
         for event in trigger.events:
             code = event.code
             if event.event_type == "line":
-                assert (
-                    isinstance(event.event_data, dict)
-                    and "line_number" in event.event_data
-                )
                 self._register_line_event_no_restart(
-                    code,
-                    event.event_data["line_number"],
-                    event_handler,
+                    code, event.line_number, event_handler
                 )
                 restart_needed = True
             elif event.event_type == "start":
@@ -70,158 +108,303 @@ class Instrumenter:
                 restart_needed = True
         
         if restart_needed:
-            sys.monitoring.restart_events()
-    
+            self._schedule_restart_events()
+
     def batch_submit(self, handlers: list["EventHandler"]) -> None:
-        for handler in handlers:
-            self.submit(handler)
-        sys.monitoring.restart_events()
+        with self.batch():
+            for handler in handlers:
+                self.submit(handler)
 
-    def _register_line_event_no_restart(
-        self, code: CodeType | None, line_number: int, event_handler: "EventHandler"
+    @contextmanager
+    def batch(self) -> Generator[None, None, None]:
+        """
+        Defer restart_events() until the outermost batch exits, so registering
+        many handlers only restarts the events once.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                self._dirty = 0
+                sys.monitoring.restart_events()
+
+    @contextmanager
+    def paused(self, code: CodeType) -> Generator[None, None, None]:
+        """
+        Turn off every event that can reach code for the duration of the
+        block: the local events of code and its nested code objects, and the
+        global events, which also pauses global handlers for other code.
+        The handlers stay registered and their state is untouched.
+        """
+        codes: list[CodeType | None] = [
+            c for c in iter_code_objects(code) if c in self._event_mask
+        ]
+        if None in self._event_mask:
+            codes.append(None)
+        if not codes:
+            yield
+            return
+        for c in codes:
+            if c is None:
+                sys.monitoring.set_events(self.tool_id, E.NO_EVENTS)
+            else:
+                sys.monitoring.set_local_events(self.tool_id, c, E.NO_EVENTS)
+        try:
+            yield
+        finally:
+            # Re-read the masks in case handlers changed inside the block
+            for c in codes:
+                self._set_events(c)
+            self._schedule_restart_events()
+
+    def _schedule_restart_events(self) -> None:
+        self._dirty += 1
+        if not self._batch_depth:
+            self._dirty = 0
+            sys.monitoring.restart_events()
+
+    def _add_handler(
+        self,
+        code: CodeType | None,
+        event_type: str,
+        line_number: int | None,
+        event_handler: "EventHandler",
     ) -> None:
-        self.handlers[code].setdefault("line", {}).setdefault(line_number, []).append(
-            event_handler
-        )
+        key = (code, event_type, line_number)
+        handlers = self.handlers.get(key)
+        if handlers is None:
+            handlers = self.handlers[key] = {}
+            counts = self._bucket_counts.setdefault(code, {})
+            counts[event_type] = counts.get(event_type, 0) + 1
+        handlers[event_handler] = None
+        self._update_dispatch(code, event_type, line_number)
+
+    def _update_dispatch(
+        self, code: CodeType | None, event_type: str, line_number: int | None
+    ) -> None:
+        handlers = self.handlers.get((code, event_type, line_number))
+        if event_type == "line":
+            # Only the changed line's tuple is rebuilt. The callbacks read the
+            # tables with single lookups, so updating them in place is safe
+            table = self._line_dispatch.get(code)
+            if handlers:
+                if table is None:
+                    table = self._line_dispatch[code] = {}
+                table[line_number] = tuple(handlers)
+            elif table is not None:
+                table.pop(line_number, None)
+                if not table:
+                    del self._line_dispatch[code]
+
+            if code is None:
+                self._update_line_callback()
+        else:
+            dispatch = (
+                self._start_dispatch if event_type == "start" else self._return_dispatch
+            )
+            if handlers:
+                dispatch[code] = tuple(handlers)
+            else:
+                dispatch.pop(code, None)
+
+    def _update_line_callback(self) -> None:
+        has_global_line = None in self._line_dispatch
+        if has_global_line != self._has_global_line:
+            self._has_global_line = has_global_line
+            sys.monitoring.register_callback(
+                self.tool_id,
+                E.LINE,
+                self.line_callback if has_global_line else self._local_line_callback,
+            )
 
+    def _set_events(self, code: CodeType | None) -> None:
+        events = self._event_mask.get(code, E.NO_EVENTS)
         if code is None:
-            events = sys.monitoring.get_events(self.tool_id)
-            sys.monitoring.set_events(self.tool_id, events | E.LINE)
+            sys.monitoring.set_events(self.tool_id, events)
         else:
-            events = sys.monitoring.get_local_events(self.tool_id, code)
-            sys.monitoring.set_local_events(self.tool_id, code, events | E.LINE)
+            sys.monitoring.set_local_events(self.tool_id, code, events)
+
+    def _register_line_event_no_restart(
+        self,
+        code: CodeType | None,
+        line_number: int | None,
+        event_handler: "EventHandler",
+    ) -> None:
+        self._add_handler(code, "line", line_number, event_handler)
+
+        self._event_mask[code] |= E.LINE
+        self._set_events(code)
     
     def register_line_event(
-        self, code: CodeType | None, line_number: int, event_handler: "EventHandler"
+        self,
+        code: CodeType | None,
+        line_number: int | None,
+        event_handler: "EventHandler",
     ) -> None:
         self._register_line_event_no_restart(code, line_number, event_handler)
-        sys.monitoring.restart_events()
-
-    def line_callback(self, code: CodeType, line_number: int):  # pragma: no cover
-        handlers = []
-        if None in self.handlers:
-            handlers.extend(self.handlers[None].get("line", {}).get(line_number, []))
-            handlers.extend(self.handlers[None].get("line", {}).get(None, []))
-        if code in self.handlers:
-            handlers.extend(self.handlers[code].get("line", {}).get(line_number, []))
-            handlers.extend(self.handlers[code].get("line", {}).get(None, []))
+        self._schedule_restart_events()
+
+    # The callbacks run on every monitored event, so the module level lookups
+    # they need are bound as default arguments
+    def line_callback(
+        self,
+        code: CodeType,
+        line_number: int,
+        _DISABLE=DISABLE,
+        _getframe=_getframe,
+    ):  # pragma: no cover
+        dispatch = self._line_dispatch
+        # Adding an empty tuple returns the other operand as is, so the common
+        # case of a single matching bucket does not allocate a new tuple
+        handlers: tuple[EventHandler, ...] = ()
+        table = dispatch.get(None)
+        if table is not None:
+            handlers = table.get(line_number, ()) + table.get(None, ())
+        table = dispatch.get(code)
+        if table is not None:
+            handlers += table.get(line_number, ()) + table.get(None, ())
         if handlers:
-            return self._process_handlers(handlers, sys._getframe(1))
-        return sys.monitoring.DISABLE
+            return self._process_handlers(handlers, _getframe(1))
+        return _DISABLE
+
+    def _local_line_callback(
+        self,
+        code: CodeType,
+        line_number: int,
+        _DISABLE=DISABLE,
+        _getframe=_getframe,
+    ):  # pragma: no cover
+        # Specialized line_callback for when there are no global line handlers.
+        # Without them, LINE events only fire for codes we set local events on,
+        # so the table lookup almost always hits
+        try:
+            table = self._line_dispatch[code]
+        except KeyError:
+            return _DISABLE
+        handlers = table.get(line_number, ()) + table.get(None, ())
+        if handlers:
+            return self._process_handlers(handlers, _getframe(1))
+        return _DISABLE
 
     def _register_start_event_no_restart(
         self, code: CodeType | None, event_handler: "EventHandler"
     ) -> None:
-        self.handlers[code].setdefault("start", []).append(event_handler)
+        self._add_handler(code, "start", None, event_handler)
 
-        if code is None:
-            events = sys.monitoring.get_events(self.tool_id)
-            sys.monitoring.set_events(self.tool_id, events | E.PY_START)
-        else:
-            events = sys.monitoring.get_local_events(self.tool_id, code)
-            sys.monitoring.set_local_events(self.tool_id, code, events | E.PY_START)
+        self._event_mask[code] |= E.PY_START
+        self._set_events(code)
     
     def register_start_event(
         self, code: CodeType | None, event_handler: "EventHandler"
     ) -> None:
         self._register_start_event_no_restart(code, event_handler)
-        sys.monitoring.restart_events()
-
-    def start_callback(self, code: CodeType, offset: int):  # pragma: no cover
-        handlers = []
-        if None in self.handlers:
-            handlers.extend(self.handlers[None].get("start", []))
-        if code in self.handlers:
-            handlers.extend(self.handlers[code].get("start", []))
+        self._schedule_restart_events()
+
+    def start_callback(
+        self,
+        code: CodeType,
+        offset: int,
+        _DISABLE=DISABLE,
+        _getframe=_getframe,
+    ):  # pragma: no cover
+        dispatch = self._start_dispatch
+        handlers = dispatch.get(None, ()) + dispatch.get(code, ())
         if handlers:
-            return self._process_handlers(handlers, sys._getframe(1))
-        return sys.monitoring.DISABLE
+            return self._process_handlers(handlers, _getframe(1))
+        return _DISABLE
 
     def _register_return_event_no_restart(
         self, code: CodeType | None, event_handler: "EventHandler"
     ) -> None:
-        self.handlers[code].setdefault("return", []).append(event_handler)
+        self._add_handler(code, "return", None, event_handler)
 
-        if code is None:
-            events = sys.monitoring.get_events(self.tool_id)
-            sys.monitoring.set_events(self.tool_id, events | E.PY_RETURN)
-        else:
-            events = sys.monitoring.get_local_events(self.tool_id, code)
-            sys.monitoring.set_local_events(self.tool_id, code, events | E.PY_RETURN)
+        self._event_mask[code] |= E.PY_RETURN
+        self._set_events(code)
     
     def register_return_event(
         self, code: CodeType | None, event_handler: "EventHandler"
     ) -> None:
         self._register_return_event_no_restart(code, event_handler)
-        sys.monitoring.restart_events()
+        self._schedule_restart_events()
 
     def return_callback(
-        self, code: CodeType, offset: int, retval: object
+        self,
+        code: CodeType,
+        offset: int,
+        retval: object,
+        _DISABLE=DISABLE,
+        _getframe=_getframe,
     ):  # pragma: no cover
-        handlers = []
-        if None in self.handlers:
-            handlers.extend(self.handlers[None].get("return", []))
-        if code in self.handlers:
-            handlers.extend(self.handlers[code].get("return", []))
+        dispatch = self._return_dispatch
+        handlers = dispatch.get(None, ()) + dispatch.get(code, ())
         if handlers:
-            return self._process_handlers(handlers, sys._getframe(1), retval=retval)
-        return sys.monitoring.DISABLE
+            return self._process_handlers(handlers, _getframe(1), retval=retval)
+        return _DISABLE
 
     def _process_handlers(
-        self, handlers: list["EventHandler"], frame: FrameType, **kwargs
+        self,
+        handlers: Sequence["EventHandler"],
+        frame: FrameType,
+        _DISABLE=DISABLE,
+        **kwargs,
     ):  # pragma: no cover
+        if len(handlers) == 1:
+            # Most locations only have a single handler
+            handler = handlers[0]
+            if handler.disabled or handler.removed:
+                return _DISABLE
+            if handler(frame, **kwargs) is _DISABLE:
+                return _DISABLE
+            return None
+
+        active = False
         for handler in handlers:
-            if handler.disabled:
+            # handlers is a snapshot, an earlier handler may have removed this one
+            if handler.disabled or handler.removed:
                 continue
 
+            active = True
             result = handler(frame, **kwargs)
-            if result is sys.monitoring.DISABLE:
-                return sys.monitoring.DISABLE
+            if result is _DISABLE:
+                return _DISABLE
+        if not active:
+            # Every handler at this location is disabled, let sys.monitoring
+            # stop firing here until enable() restarts the events
+            return _DISABLE
         return None
 
     def restart_events(self) -> None:
-        sys.monitoring.restart_events()
+        self._schedule_restart_events()
 
     def remove_handler(self, event_handler: "EventHandler") -> None:
         trigger = event_handler.trigger
         for event in trigger.events:
             code = event.code
-            if code not in self.handlers or event.event_type not in self.handlers[code]:
+            key = (code, event.event_type, event.line_number)
+
+            handlers = self.handlers.get(key)
+            if handlers is None or event_handler not in handlers:
                 continue
-            if event.event_type == "line":
-                assert (
-                    isinstance(event.event_data, dict)
-                    and "line_number" in event.event_data
-                )
-                handlers = self.handlers[code]["line"].get(
-                    event.event_data["line_number"], []
-                )
+
+            del handlers[event_handler]
+            self._update_dispatch(*key)
+            if handlers:
+                continue
+
+            del self.handlers[key]
+            counts = self._bucket_counts[code]
+            counts[event.event_type] -= 1
+            if counts[event.event_type]:
+                continue
+
+            del counts[event.event_type]
+            if not counts:
+                # Nothing left for this code, stop monitoring it entirely
+                del self._bucket_counts[code]
+                del self._event_mask[code]
+                self._set_events(code)
             else:
-                handlers = self.handlers[code][event.event_type]
-
-            if event_handler in handlers:
-                handlers.remove(event_handler)
-
-                if event.event_type == "line" and not handlers:
-                    assert (
-                        isinstance(event.event_data, dict)
-                        and "line_number" in event.event_data
-                    )
-                    del self.handlers[code]["line"][event.event_data["line_number"]]
-
-                if not self.handlers[code][event.event_type]:
-                    del self.handlers[code][event.event_type]
-                    removed_event = {
-                        "line": E.LINE,
-                        "start": E.PY_START,
-                        "return": E.PY_RETURN,
-                    }[event.event_type]
-
-                    if code is None:
-                        events = sys.monitoring.get_events(self.tool_id)
-                        sys.monitoring.set_events(self.tool_id, events & ~removed_event)
-                    else:
-                        events = sys.monitoring.get_local_events(self.tool_id, code)
-                        sys.monitoring.set_local_events(
-                            self.tool_id, code, events & ~removed_event
-                        )
+                self._event_mask[code] &= ~_EVENT_MASKS[event.event_type]
+                self._set_events(code)
@@ -4,11 +4,14 @@
 
 from __future__ import annotations
 
+import io
+import math
 import time
-from collections import defaultdict, namedtuple
+from collections import OrderedDict
 from contextlib import contextmanager
+from dataclasses import dataclass
 from types import FunctionType, MethodType, CodeType
-from typing import Generator, Optional, Union, Dict, List, Any, IO
+from typing import Callable, Generator, NamedTuple, Optional, Union, Dict, List, Any, IO
 import threading
 import json
 import logging
@@ -16,14 +19,46 @@ from pathlib import Path
 
 from .instrumenter import Instrumenter
 
+try:
+    import orjson  # type: ignore[import-not-found, unused-ignore]
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment, unused-ignore]
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-PerformanceStats = namedtuple('PerformanceStats', [
-    'total_time', 'call_count', 'avg_time', 'min_time', 'max_time',
-    'overhead_percent', 'baseline_time'
-])
+@dataclass(slots=True)
+class _Agg:
+    """Running aggregate of measured call times, in nanoseconds."""
+    total: int = 0
+    n: int = 0
+    mn: float = math.inf
+    mx: float = 0.0
+
+# Whether profiling is on. Kept at module level so hot call sites can check
+# it without going through the PerformanceProfiler singleton
+_PROFILING_ACTIVE = False
+
+
+def is_profiling_active() -> bool:
+    """Return whether performance profiling is currently active.
+    
+    Returns:
+        bool: True between start_profiling() and stop_profiling().
+    """
+    return _PROFILING_ACTIVE
+
+
+class PerformanceStats(NamedTuple):
+    """Performance statistics for a single code object, times in seconds."""
+    total_time: float
+    call_count: int
+    avg_time: float
+    min_time: float
+    max_time: float
+    overhead_percent: float
+    baseline_time: float
 
 class PerformanceProfiler:
     """A performance profiler for measuring the overhead of dowhen instrumentation.
@@ -36,11 +71,17 @@ class PerformanceProfiler:
         _instance: The singleton instance of the profiler.
         _lock: A lock to ensure thread-safe singleton initialization.
         _active: Whether the profiler is currently active.
-        _baseline_data: Dictionary storing baseline performance data.
-        _instrumented_data: Dictionary storing instrumented performance data.
-        _call_counts: Dictionary storing call counts for each code object.
+        _baseline_data: Dictionary storing baseline timing aggregates.
+        _instrumented_data: Dictionary storing instrumented timing aggregates.
         _handlers: Dictionary storing handlers for each code object.
+        _max_tracked_entities: Maximum number of code objects kept in each
+            of the dictionaries above before the least recently used is dropped.
     """
+    __slots__ = (
+        '_baseline_data', '_instrumented_data', '_handlers', '_original_callbacks',
+        '_default_iterations', '_max_tracked_entities',
+    )
+    
     _instance = None
     _lock = threading.Lock()
     
@@ -57,15 +98,19 @@ class PerformanceProfiler:
                     cls._instance._initialize()
         return cls._instance
     
+    @property
+    def _active(self) -> bool:
+        """Whether the profiler is currently active."""
+        return _PROFILING_ACTIVE
+    
     def _initialize(self) -> None:
         """Initialize the profiler with default settings."""
-        self._active = False
-        self._baseline_data: Dict[CodeType, List[float]] = defaultdict(list)
-        self._instrumented_data: Dict[CodeType, List[float]] = defaultdict(list)
-        self._call_counts: Dict[CodeType, int] = defaultdict(int)
-        self._handlers: Dict[CodeType, List[Any]] = defaultdict(list)
+        self._baseline_data: OrderedDict[CodeType, _Agg] = OrderedDict()
+        self._instrumented_data: OrderedDict[CodeType, _Agg] = OrderedDict()
+        self._handlers: OrderedDict[CodeType, List[Any]] = OrderedDict()
         self._original_callbacks = {}
         self._default_iterations = 100
+        self._max_tracked_entities = 1024
     
     @contextmanager
     def profile_scope(self, entity: Union[FunctionType, MethodType, CodeType], 
@@ -80,7 +125,7 @@ class PerformanceProfiler:
         Yields:
             None
         """
-        if not self._active:
+        if not _PROFILING_ACTIVE:
             yield
             return
             
@@ -98,7 +143,8 @@ class PerformanceProfiler:
         
         Enables performance data collection.
         """
-        self._active = True
+        global _PROFILING_ACTIVE
+        _PROFILING_ACTIVE = True
         logger.info("Performance profiling started")
     
     def stop_profiling(self) -> None:
@@ -106,7 +152,8 @@ class PerformanceProfiler:
         
         Disables performance data collection.
         """
-        self._active = False
+        global _PROFILING_ACTIVE
+        _PROFILING_ACTIVE = False
         logger.info("Performance profiling stopped")
     
     def register_handler(self, handler: Any) -> None:
@@ -115,14 +162,20 @@ class PerformanceProfiler:
         Args:
             handler: The handler to register.
         """
-        if not self._active:
+        if not _PROFILING_ACTIVE:
             return
             
         try:
             for event in handler.trigger.events:
                 if event.code:
-                    self._handlers[event.code].append(handler)
-                    logger.debug(f"Registered handler for code object: {event.code.co_name}")
+                    handlers = self._handlers.get(event.code)
+                    if handlers is None:
+                        handlers = []
+                        self._track(self._handlers, event.code, handlers)
+                    else:
+                        self._handlers.move_to_end(event.code)
+                    handlers.append(handler)
+                    logger.debug("Registered handler for code object: %s", event.code.co_name)
         except Exception as e:
             logger.error(f"Failed to register handler: {e}")
     
@@ -135,7 +188,7 @@ class PerformanceProfiler:
         Returns:
             Dict: Performance statistics.
         """
-        if not self._active:
+        if not _PROFILING_ACTIVE:
             return {}
             
         if entity is None:
@@ -148,8 +201,8 @@ class PerformanceProfiler:
         """Clear all performance statistics."""
         self._baseline_data.clear()
         self._instrumented_data.clear()
-        self._call_counts.clear()
         self._handlers.clear()
+        self._original_callbacks.clear()
         logger.info("Performance statistics cleared")
     
     def set_default_iterations(self, iterations: int) -> None:
@@ -170,6 +223,43 @@ class PerformanceProfiler:
         """
         return self._default_iterations
     
+    def set_max_tracked_entities(self, max_entities: int) -> None:
+        """Set how many code objects the profiler keeps data for.
+        
+        Once the limit is reached, the least recently recorded code object is
+        dropped. Lowering the limit trims the existing data immediately.
+        
+        Args:
+            max_entities: Maximum number of tracked code objects.
+        """
+        if max_entities > 0:
+            self._max_tracked_entities = max_entities
+            for store in (self._baseline_data, self._instrumented_data, self._handlers):
+                while len(store) > max_entities:
+                    store.popitem(last=False)
+            logger.info(f"Max tracked entities set to: {max_entities}")
+    
+    def get_max_tracked_entities(self) -> int:
+        """Get how many code objects the profiler keeps data for.
+        
+        Returns:
+            int: Maximum number of tracked code objects.
+        """
+        return self._max_tracked_entities
+    
+    def _track(self, store: OrderedDict, code_obj: CodeType, value: Any) -> None:
+        """Store a value for a code object, evicting the least recently used one.
+        
+        Args:
+            store: The dictionary to store the value in.
+            code_obj: The code object the value belongs to.
+            value: The value to store.
+        """
+        store[code_obj] = value
+        store.move_to_end(code_obj)
+        if len(store) > self._max_tracked_entities:
+            store.popitem(last=False)
+    
     def _get_code_object(self, entity: Union[FunctionType, MethodType, CodeType]) -> CodeType:
         """Get the code object from an entity.
         
@@ -202,28 +292,14 @@ class PerformanceProfiler:
         if not func:
             return
             
-        original_handlers = []
-        instrumenter = Instrumenter()
         try:
-            if code_obj in instrumenter.handlers:
-                original_handlers = instrumenter.handlers[code_obj].get('line', {}).get(None, []).copy()
-                for handler in original_handlers:
-                    handler.disable()
-            
-            times = []
-            for _ in range(iterations):
-                start = time.perf_counter()
-                func(0)  # Assume 0 is a valid argument, this could be improved
-                end = time.perf_counter()
-                times.append(end - start)
-            
-            self._baseline_data[code_obj] = times
-            logger.debug(f"Collected baseline data for {code_obj.co_name}: {len(times)} samples")
+            # Pause the code object's events rather than toggling each handler
+            with Instrumenter().paused(code_obj):
+                aggregate = self._time_calls(func, iterations)
+            self._track(self._baseline_data, code_obj, aggregate)
+            logger.debug("Collected baseline data for %s: %d samples", code_obj.co_name, aggregate.n)
         except Exception as e:
             logger.error(f"Failed to collect baseline data for {code_obj.co_name}: {e}")
-        finally:
-            for handler in original_handlers:
-                handler.enable()
     
     def _collect_instrumented(self, entity: Union[FunctionType, MethodType, CodeType], 
                              iterations: int) -> None:
@@ -239,20 +315,46 @@ class PerformanceProfiler:
         if not func:
             return
             
-        times = []
         try:
-            for _ in range(iterations):
-                start = time.perf_counter()
-                func(0)  # Assume 0 is a valid argument, this could be improved
-                end = time.perf_counter()
-                times.append(end - start)
-                self._call_counts[code_obj] += 1
-            
-            self._instrumented_data[code_obj] = times
-            logger.debug(f"Collected instrumented data for {code_obj.co_name}: {len(times)} samples")
+            aggregate = self._time_calls(func, iterations)
+            self._track(self._instrumented_data, code_obj, aggregate)
+            logger.debug("Collected instrumented data for %s: %d samples", code_obj.co_name, aggregate.n)
         except Exception as e:
             logger.error(f"Failed to collect instrumented data for {code_obj.co_name}: {e}")
     
+    def _time_calls(self, func: Callable, iterations: int) -> _Agg:
+        """Time repeated calls of a function.
+        
+        Only running aggregates are kept, so memory use does not grow with
+        the number of iterations. One untimed warmup call is made first so
+        one-off costs (cache fills, bytecode specialization) are not measured.
+        
+        Args:
+            func: The function to call.
+            iterations: Number of calls to time.
+        
+        Returns:
+            _Agg: Total, count, minimum and maximum call time in nanoseconds.
+        """
+        pc = time.perf_counter_ns
+        total = 0
+        count = 0
+        min_time = math.inf
+        max_time = 0.0
+        if iterations > 0:
+            func(0)
+        for _ in range(iterations):
+            start = pc()
+            func(0)  # Assume 0 is a valid argument, this could be improved
+            elapsed = pc() - start
+            total += elapsed
+            count += 1
+            if elapsed < min_time:
+                min_time = elapsed
+            if elapsed > max_time:
+                max_time = elapsed
+        return _Agg(total, count, min_time, max_time)
+    
     def _generate_entity_report(self, code_obj: CodeType) -> PerformanceStats:
         """Generate a performance report for a single entity.
         
@@ -262,26 +364,24 @@ class PerformanceProfiler:
         Returns:
             PerformanceStats: The performance statistics for the entity.
         """
-        if not self._baseline_data.get(code_obj) or not self._instrumented_data.get(code_obj):
+        baseline = self._baseline_data.get(code_obj)
+        instrumented = self._instrumented_data.get(code_obj)
+        # An aggregate with no samples (e.g. iterations <= 0) has nothing to report
+        if baseline is None or instrumented is None or not baseline.n or not instrumented.n:
             return PerformanceStats(0, 0, 0, 0, 0, 0, 0)
             
-        baseline_times = self._baseline_data[code_obj]
-        instrumented_times = self._instrumented_data[code_obj]
         
-        total_baseline = sum(baseline_times)
-        total_instrumented = sum(instrumented_times)
-        
-        avg_baseline = total_baseline / len(baseline_times)
-        avg_instrumented = total_instrumented / len(instrumented_times)
+        avg_baseline = baseline.total / baseline.n / 1e9
+        avg_instrumented = instrumented.total / instrumented.n / 1e9
         
         overhead = ((avg_instrumented - avg_baseline) / avg_baseline) * 100 if avg_baseline > 0 else 0
         
         return PerformanceStats(
-            total_time=total_instrumented,
-            call_count=self._call_counts[code_obj],
+            total_time=instrumented.total / 1e9,
+            call_count=instrumented.n,
             avg_time=avg_instrumented,
-            min_time=min(instrumented_times),
-            max_time=max(instrumented_times),
+            min_time=instrumented.mn / 1e9,
+            max_time=instrumented.mx / 1e9,
             overhead_percent=overhead,
             baseline_time=avg_baseline
         )
@@ -293,7 +393,7 @@ class PerformanceProfiler:
             Dict[CodeType, PerformanceStats]: Performance statistics for all entities.
         """
         report = {}
-        for code_obj in set(list(self._baseline_data.keys()) + list(self._instrumented_data.keys())):
+        for code_obj in self._baseline_data.keys() | self._instrumented_data.keys():
             report[code_obj] = self._generate_entity_report(code_obj)
         return report
     
@@ -303,6 +403,10 @@ class PerformanceProfiler:
         Args:
             code_obj: The code object to generate the report for.
         """
+        # The report is only logged, so skip building it when INFO is filtered out
+        if not logger.isEnabledFor(logging.INFO):
+            return
+            
         stats = self._generate_entity_report(code_obj)
         if stats.call_count == 0:
             return
@@ -316,7 +420,7 @@ class PerformanceProfiler:
         logger.info(f"Performance overhead: {stats.overhead_percent:.2f}%")
         logger.info(f"Total execution time: {stats.total_time:.6f} seconds")
         logger.info(f"Minimum/Maximum Time: {stats.min_time:.6f} / {stats.max_time:.6f} seconds")
-        logger.info(f"\nNumber of processors: {len(self._handlers.get(code_obj, []))}")
+        logger.info(f"\nNumber of processors: {len(self._handlers.get(code_obj, ()))}")
         logger.info("-"*60)
 
 class PerformanceReport:
@@ -325,6 +429,8 @@ class PerformanceReport:
     Attributes:
         stats: Dictionary of performance statistics.
     """
+    __slots__ = ('stats',)
+    
     def __init__(self, stats: Dict[CodeType, PerformanceStats]):
         """Initialize the performance report.
         
@@ -342,10 +448,10 @@ class PerformanceReport:
         if not self.stats:
             return "No performance data available"
             
-        total_overhead = 0
+        total_overhead = 0.0
         total_calls = 0
         worst_entity = None
-        worst_overhead = -1
+        worst_overhead = -1.0
         
         for code_obj, stat in self.stats.items():
             total_overhead += stat.overhead_percent * stat.call_count
@@ -357,33 +463,34 @@ class PerformanceReport:
                 
         avg_overhead = total_overhead / total_calls if total_calls > 0 else 0
         
-        report = []
-        report.append("=" * 60)
-        report.append("DOWHEN Performance Impact Analysis Report")
-        report.append("=" * 60)
-        report.append(f"Number of code objects analyzed: {len(self.stats)}")
-        report.append(f"Total number of calls: {total_calls:,}")
-        report.append(f"Average performance overhead: {avg_overhead:.2f}%")
+        buf = io.StringIO()
+        w = buf.write
+        w("=" * 60 + "\n")
+        w("DOWHEN Performance Impact Analysis Report\n")
+        w("=" * 60 + "\n")
+        w(f"Number of code objects analyzed: {len(self.stats)}\n")
+        w(f"Total number of calls: {total_calls:,}\n")
+        w(f"Average performance overhead: {avg_overhead:.2f}%\n")
         
         if worst_entity:
             worst_stat = self.stats[worst_entity]
-            report.append(f"\nThe function with the highest overhead: {worst_entity.co_name}")
-            report.append(f"  - Overhead: {worst_stat.overhead_percent:.2f}%")
-            report.append(f"  - Number of calls: {worst_stat.call_count:,}")
-            report.append(f"  - Average execution time: {worst_stat.avg_time:.6f} seconds")
+            w(f"\nThe function with the highest overhead: {worst_entity.co_name}\n")
+            w(f"  - Overhead: {worst_stat.overhead_percent:.2f}%\n")
+            w(f"  - Number of calls: {worst_stat.call_count:,}\n")
+            w(f"  - Average execution time: {worst_stat.avg_time:.6f} seconds\n")
         
-        report.append("\nRecommendation:")
+        w("\nRecommendation:\n")
         if avg_overhead > 10:
-            report.append("  - Performance overhead is significant; consider reducing the number of instrumentation points or optimizing conditional expressions.")
+            w("  - Performance overhead is significant; consider reducing the number of instrumentation points or optimizing conditional expressions.\n")
         elif avg_overhead > 5:
-            report.append("  - Moderate performance overhead, monitoring the performance impact on the critical path.")
+            w("  - Moderate performance overhead, monitoring the performance impact on the critical path.\n")
         else:
-            report.append("  - Performance overhead is low and acceptable for the current configuration.")
+            w("  - Performance overhead is low and acceptable for the current configuration.\n")
             
-        report.append("\nTip: Use clear_all() to clear unnecessary processors for improved performance.")
-        report.append("=" * 60)
+        w("\nTip: Use clear_all() to clear unnecessary processors for improved performance.\n")
+        w("=" * 60)
         
-        return "\n".join(report)
+        return buf.getvalue()
     
     def detailed(self) -> str:
         """Generate a detailed report.
@@ -394,23 +501,24 @@ class PerformanceReport:
         if not self.stats:
             return "No performance data available"
             
-        report = []
-        report.append("=" * 80)
-        report.append("DOWHEN Detailed Performance Analysis Report")
-        report.append("=" * 80)
+        buf = io.StringIO()
+        w = buf.write
+        w("=" * 80 + "\n")
+        w("DOWHEN Detailed Performance Analysis Report\n")
+        w("=" * 80 + "\n")
         
         for i, (code_obj, stat) in enumerate(self.stats.items(), 1):
-            report.append(f"\n{i}. Function: {code_obj.co_name} (File: {code_obj.co_filename}, Line: {code_obj.co_firstlineno})")
-            report.append("-" * 80)
-            report.append(f"  Number of calls: {stat.call_count:,}")
-            report.append(f"  Baseline average time: {stat.baseline_time:.8f} seconds")
-            report.append(f"  Average time after instrumentation: {stat.avg_time:.8f} seconds")
-            report.append(f"  Performance overhead: {stat.overhead_percent:.2f}%")
-            report.append(f"  Total time spent: {(stat.avg_time - stat.baseline_time) * stat.call_count:.8f} seconds")
-            report.append(f"  Execution timeframe: [{stat.min_time:.8f}, {stat.max_time:.8f}] seconds")
-        
-        report.append("\n" + "=" * 80)
-        return "\n".join(report)
+            w(f"\n{i}. Function: {code_obj.co_name} (File: {code_obj.co_filename}, Line: {code_obj.co_firstlineno})\n")
+            w("-" * 80 + "\n")
+            w(f"  Number of calls: {stat.call_count:,}\n")
+            w(f"  Baseline average time: {stat.baseline_time:.8f} seconds\n")
+            w(f"  Average time after instrumentation: {stat.avg_time:.8f} seconds\n")
+            w(f"  Performance overhead: {stat.overhead_percent:.2f}%\n")
+            w(f"  Total time spent: {(stat.avg_time - stat.baseline_time) * stat.call_count:.8f} seconds\n")
+            w(f"  Execution timeframe: [{stat.min_time:.8f}, {stat.max_time:.8f}] seconds\n")
+        
+        w("\n" + "=" * 80)
+        return buf.getvalue()
     
     def to_dict(self) -> Dict:
         """Convert the report to a dictionary format.
@@ -418,16 +526,12 @@ class PerformanceReport:
         Returns:
             Dict: Report data in dictionary format.
         """
-        report_dict = {
-            "summary": {
-                "total_objects": len(self.stats),
-                "total_calls": sum(stat.call_count for stat in self.stats.values()),
-            },
-            "details": {}
-        }
+        total_calls = 0
+        details = {}
         
         for code_obj, stat in self.stats.items():
-            report_dict["details"][f"{code_obj.co_name} ({code_obj.co_filename}:{code_obj.co_firstlineno})"] = {
+            total_calls += stat.call_count
+            details[f"{code_obj.co_name} ({code_obj.co_filename}:{code_obj.co_firstlineno})"] = {
                 "call_count": stat.call_count,
                 "avg_time": stat.avg_time,
                 "baseline_time": stat.baseline_time,
@@ -437,11 +541,22 @@ class PerformanceReport:
                 "max_time": stat.max_time
             }
         
-        return report_dict
+        return {
+            "summary": {
+                "total_objects": len(self.stats),
+                "total_calls": total_calls,
+            },
+            "details": details
+        }
     
     def to_json(self, file_path: Optional[Union[str, Path]] = None, indent: int = 2) -> Optional[str]:
         """Export the report to JSON format.
         
+        When orjson is installed and indent is 2, it is used for encoding. The
+        result decodes to the same data, but the text can differ from the stdlib
+        json module, e.g. non-ASCII characters are not escaped and small floats
+        are not written in exponent form.
+        
         Args:
             file_path: Optional file path to save the JSON report. If None, returns the JSON string.
             indent: Number of spaces to use for indentation.
@@ -451,6 +566,14 @@ class PerformanceReport:
         """
         report_dict = self.to_dict()
         
+        # orjson is faster when installed, but it only supports a 2-space indent
+        if orjson is not None and indent == 2:
+            data = orjson.dumps(report_dict, option=orjson.OPT_INDENT_2)
+            if file_path:
+                Path(file_path).write_bytes(data)
+                return None
+            return data.decode()
+        
         if file_path:
             with open(file_path, 'w') as f:
                 json.dump(report_dict, f, indent=indent)
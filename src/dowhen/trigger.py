@@ -11,7 +11,12 @@ from types import CodeType, FrameType, FunctionType, MethodType, ModuleType
 from typing import TYPE_CHECKING, Any, Literal
 
 from .types import IdentifierType
-from .util import call_in_frame, get_line_numbers, get_source_hash, getrealsourcelines
+from .util import (
+    compile_frame_invoker,
+    get_line_numbers,
+    get_source_hash,
+    getrealsourcelines,
+)
 
 if TYPE_CHECKING:  # pragma: no cover
     from .callback import Callback
@@ -31,6 +36,10 @@ class _Event:
         self.code = code
         self.event_type = event_type
         self.event_data = event_data or {}
+        if event_type == "line" and "line_number" not in self.event_data:
+            raise ValueError("A line event requires a line_number.")
+        # None for start/return events, and for line events on every line
+        self.line_number: int | None = self.event_data.get("line_number")
 
 
 class Trigger:
@@ -43,6 +52,8 @@ class Trigger:
         self.events = events
         self.condition = condition
         self.is_global = is_global
+        # Built on first use so errors surface in should_fire like before
+        self._condition_invoker: Callable[[FrameType, dict], Any] | None = None
 
     @classmethod
     def _get_code_from_entity(
@@ -228,7 +239,12 @@ class Trigger:
             if isinstance(self.condition, str):
                 return eval(self.condition, frame.f_globals, frame.f_locals)
             elif callable(self.condition):
-                return call_in_frame(self.condition, frame)
+                invoker = self._condition_invoker
+                if invoker is None:
+                    invoker = self._condition_invoker = compile_frame_invoker(
+                        self.condition
+                    )
+                return invoker(frame, {})
         except Exception:
             return False
 
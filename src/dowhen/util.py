@@ -6,48 +6,158 @@ from __future__ import annotations
 
 import functools
 import inspect
+import linecache
+import os
 import re
-from collections.abc import Callable
+import sys
+import weakref
+from collections.abc import Callable, Iterator
+from itertools import compress, count
+from operator import methodcaller
 from types import CodeType, FrameType, FunctionType, MethodType, ModuleType
 from typing import Any
 
 from .types import IdentifierType
 
+_DECORATOR_RE = re.compile(r"\s*@")
 
-def getrealsourcelines(obj) -> tuple[list[str], int]:
+
+def _getsourcelines(obj) -> tuple[list[str], int] | None:
+    """
+    Same as inspect.getsourcelines, but read functions and code objects
+    straight from linecache. That skips inspect's module lookup, which can
+    scan all of sys.modules. Return None when they have no source, rather
+    than raising OSError.
+    """
+    obj = inspect.unwrap(obj)
+    code = getattr(obj, "__code__", obj)
+    if isinstance(code, CodeType):
+        filename = code.co_filename
+        linecache.checkcache(filename)
+        # A function's globals let linecache fall back to its module's loader
+        lines = linecache.getlines(filename, getattr(obj, "__globals__", None))
+        lnum = code.co_firstlineno - 1
+        if 0 <= lnum < len(lines):
+            return inspect.getblock(lines[lnum:]), lnum + 1
+        if not lines and (
+            code is not obj or (filename.startswith("<") and filename.endswith(">"))
+        ):
+            # Nothing else can find the source, e.g. code compiled from a string
+            return None
+    # Let inspect handle classes, modules and the sources it needs a loader for
+    return inspect.getsourcelines(obj)
+
+
+def _source_stamp(entity: Any) -> tuple[int, int] | None:
+    """
+    Get the size and mtime of the file entity's source is read from, or None
+    when there is no file to check, e.g. code compiled from a string. Cached
+    source data is only reused while this stays the same.
+    """
+    code = getattr(entity, "__code__", entity)
+    filename: str | None
+    if isinstance(code, CodeType):
+        filename = code.co_filename
+    elif isinstance(entity, ModuleType):
+        filename = getattr(entity, "__file__", None)
+    elif isinstance(entity, type):
+        module = sys.modules.get(entity.__module__)
+        filename = getattr(module, "__file__", None)
+    else:
+        return None
+    if not filename or (filename.startswith("<") and filename.endswith(">")):
+        return None
     try:
-        lines, start_line = inspect.getsourcelines(obj)
-        # We need to find the actual definition of the function/class
-        # when it is decorated
-        while lines[0].strip().startswith("@"):
-            # If the first line is a decorator, we need to skip it
-            # and move to the next line
-            lines.pop(0)
-            start_line += 1
+        st = os.stat(filename)
     except OSError:
-        lines, start_line = [], obj.co_firstlineno
+        return None
+    return st.st_size, st.st_mtime_ns
+
 
-    return lines, start_line
+# Same policy as _source_hash_cache: weak keys so entities are not kept
+# alive, and each entry is only reused while its source file is unchanged
+_sourcelines_cache: weakref.WeakKeyDictionary[
+    Any, tuple[tuple[int, int] | None, tuple[tuple[str, ...], int]]
+] = weakref.WeakKeyDictionary()
 
 
+def getrealsourcelines(obj) -> tuple[tuple[str, ...], int]:
+    """
+    Get the source lines of obj without its decorators. The result is
+    cached per object, so the lines are returned as an immutable tuple.
+    """
+    stamp = _source_stamp(obj)
+    cached = _sourcelines_cache.get(obj)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    result = _getrealsourcelines(obj)
+    _sourcelines_cache[obj] = (stamp, result)
+    return result
+
+
+def _getrealsourcelines(obj) -> tuple[tuple[str, ...], int]:
+    try:
+        source = _getsourcelines(obj)
+    except OSError:
+        source = None
+    if source is None:
+        # Fall back to the definition line, functions keep it on their code
+        return (), getattr(obj, "__code__", obj).co_firstlineno
+
+    lines, start_line = source
+    # We need to find the actual definition of the function/class
+    # when it is decorated, so skip the leading decorator lines
+    i = 0
+    while i < len(lines) and _DECORATOR_RE.match(lines[i]):
+        i += 1
+    if i:
+        lines = lines[i:]
+        start_line += i
+
+    return tuple(lines), start_line
+
+
+@functools.lru_cache(maxsize=512)
 def get_all_code_objects(code: CodeType) -> list[CodeType]:
     """
     Recursively get all code objects from the given code object.
     """
-    all_code_objects = []
+    return list(iter_code_objects(code))
+
+
+def iter_code_objects(code: CodeType) -> Iterator[CodeType]:
+    """
+    Recursively yield all code objects from the given code object, in the
+    same order as get_all_code_objects.
+    """
     stack = [code]
     while stack:
         current_code = stack.pop()
         assert isinstance(current_code, CodeType)
 
-        all_code_objects.append(current_code)
+        yield current_code
         for const in current_code.co_consts:
             if isinstance(const, CodeType):
                 stack.append(const)
 
-    return all_code_objects
+
+@functools.lru_cache(maxsize=512)
+def _get_code_lines(code: CodeType) -> tuple[frozenset[int], int]:
+    """
+    Get the line numbers of code and how many lines past co_firstlineno
+    it spans. Cached because every lookup on an enclosing code object
+    walks all of its nested code objects.
+    """
+    lines = frozenset(
+        line_no for _, _, line_no in code.co_lines() if line_no is not None
+    )
+    if not lines:
+        return lines, 0
+    return lines, max(lines) - code.co_firstlineno
 
 
+@functools.lru_cache(maxsize=512)
 def get_line_numbers(
     code: CodeType, identifier: IdentifierType | tuple[IdentifierType, ...]
 ) -> dict[CodeType, list[int]]:
@@ -57,70 +167,78 @@ def get_line_numbers(
     line_numbers_ret: dict[CodeType, list[int]] = {}
     line_numbers_sets = []
 
-    try:
+    stripped_lines: tuple[str, ...] = ()
+    start_line = 0
+    # Plain line numbers need no source, so only read it for str/regex.
+    # getrealsourcelines gives no lines for code objects without source
+    if not all(isinstance(ident, int) for ident in identifier):
         lines, start_line = getrealsourcelines(code)
-        has_source = True
-    except OSError:
-        # Handle compiled code objects without source
-        lines = []
-        start_line = 0
-        has_source = False
+        # Strip once and share the result across all identifiers
+        stripped_lines = tuple(map(str.strip, lines))
 
     for ident in identifier:
         if isinstance(ident, int):
             line_numbers_set = {ident}
         else:
-            if not has_source:
+            if not stripped_lines:
                 # Cannot search by string/regex for compiled code
                 return {}
-            
-            if isinstance(ident, str) or isinstance(ident, re.Pattern):
-                line_numbers_set = set()
-                for i, line in enumerate(lines):
-                    line = line.strip()
-                    if (isinstance(ident, str) and line.startswith(ident)) or (
-                        isinstance(ident, re.Pattern) and ident.match(line)
-                    ):
-                        line_number = start_line + i
-                        line_numbers_set.add(line_number)
+
+            # Scan the lines with map/compress so the per-line loop runs in C
+            if isinstance(ident, str):
+                matches = map(methodcaller("startswith", ident), stripped_lines)
+            elif isinstance(ident, re.Pattern):
+                matches = map(ident.match, stripped_lines)
             else:
                 raise TypeError(f"Unknown identifier type: {type(ident)}")
+            line_numbers_set = set(compress(count(start_line), matches))
 
         if not line_numbers_set:
             return {}
         line_numbers_sets.append(line_numbers_set)
 
-    agreed_line_numbers = set.intersection(*line_numbers_sets)
-    
-    line_to_code = {}
-    for sub_code in get_all_code_objects(code):
-        for start, end, line_no in sub_code.co_lines():
-            if line_no is not None:
-                existing = line_to_code.get(line_no)
-                if existing is None:
-                    line_to_code[line_no] = sub_code
-                elif has_source:
-                    try:
-                        # Only compare source lengths if source is available
-                        if len(inspect.getsource(existing).splitlines()) < len(inspect.getsource(sub_code).splitlines()):
-                            line_to_code[line_no] = sub_code
-                    except OSError:
-                        # If source is not available for either, just keep the first one
-                        pass
-    
-    for line_number in agreed_line_numbers:
+    # Intersect starting from the smallest set and stop as soon as it is empty
+    line_numbers_sets.sort(key=len)
+    agreed_line_numbers = line_numbers_sets[0]
+    for line_numbers_set in line_numbers_sets[1:]:
+        agreed_line_numbers &= line_numbers_set
+        if not agreed_line_numbers:
+            return {}
+
+    # When a line belongs to several code objects (e.g. the def line of a
+    # nested function), pick the one spanning the most lines. The span is
+    # derived from co_lines() rather than from the source of each code object
+    line_to_code: dict[int, CodeType] = {}
+    spans: dict[CodeType, int] = {}
+    for sub_code in iter_code_objects(code):
+        sub_lines, span = _get_code_lines(sub_code)
+        if not sub_lines:
+            continue
+        spans[sub_code] = span
+        for line_no in sub_lines & agreed_line_numbers:
+            existing = line_to_code.get(line_no)
+            if existing is None or spans[existing] < span:
+                line_to_code[line_no] = sub_code
+
+    # Walking the lines in order keeps every per-code list sorted
+    for line_number in sorted(agreed_line_numbers):
         if line_number in line_to_code:
             sub_code = line_to_code[line_number]
             line_numbers_ret.setdefault(sub_code, []).append(line_number)
 
-    for line_numbers in line_numbers_ret.values():
-        line_numbers.sort()
-
     return line_numbers_ret
 
 
-def get_func_args(func: Callable) -> list[str]:
-    args = inspect.getfullargspec(inspect.unwrap(func)).args
+@functools.lru_cache(maxsize=512)
+def get_func_args(func: Callable) -> tuple[str, ...]:
+    unwrapped = inspect.unwrap(func)
+    code = getattr(unwrapped, "__code__", None)
+    if isinstance(code, CodeType):
+        # The positional arguments come first in co_varnames, which is much
+        # cheaper than building a full signature
+        args = code.co_varnames[: code.co_argcount]
+    else:
+        args = tuple(inspect.getfullargspec(unwrapped).args)
     # For bound methods, skip the first argument since it's already bound
     if inspect.ismethod(func):
         return args[1:]
@@ -128,94 +246,13 @@ def get_func_args(func: Callable) -> list[str]:
         return args
 
 
-class AdaptiveCache:
-    def __init__(self, initial_size=256, growth_factor=1.2, shrink_factor=0.8, 
-                 hit_ratio_threshold=0.7, check_interval=100):
-        from collections import OrderedDict
-        self.cache = OrderedDict()  # Use OrderedDict for LRU behavior
-        self.maxsize = initial_size
-        self.hits = 0
-        self.misses = 0
-        self.access_count = 0
-        self.growth_factor = growth_factor
-        self.shrink_factor = shrink_factor
-        self.hit_ratio_threshold = hit_ratio_threshold
-        self.check_interval = check_interval
-        
-    def __call__(self, func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            key = (args, tuple(sorted(kwargs.items())))
-            
-            self.access_count += 1
-            if self.access_count >= self.check_interval:
-                self._adjust_cache_size()
-                self.access_count = 0
-            
-            if key in self.cache:
-                self.hits += 1
-                # Move the accessed item to the end to mark it as recently used
-                self.cache.move_to_end(key)
-                return self.cache[key]
-            
-            self.misses += 1
-            
-            result = func(*args, **kwargs)
-            
-            if len(self.cache) >= self.maxsize:
-                self._cleanup_cache()
-            
-            # Add the new item to the end
-            self.cache[key] = result
-            return result
-        
-        # Add cache_clear method to the wrapper function
-        def cache_clear():
-            self.cache.clear()
-            self.hits = 0
-            self.misses = 0
-            self.access_count = 0
-        
-        wrapper.cache_clear = cache_clear
-        wrapper._cache_instance = self  # Store a reference to the cache instance for debugging
-        
-        return wrapper
-    
-    def _adjust_cache_size(self):
-        if self.hits + self.misses == 0:
-            return
-            
-        hit_ratio = self.hits / (self.hits + self.misses)
-        
-        if hit_ratio > self.hit_ratio_threshold and self.maxsize < 10000:
-            new_size = int(self.maxsize * self.growth_factor)
-            self.maxsize = min(new_size, 10000)
-        elif hit_ratio < self.hit_ratio_threshold * 0.5 and self.maxsize > 64:
-            new_size = int(self.maxsize * self.shrink_factor)
-            self.maxsize = max(new_size, 64)
-            # If we're shrinking the cache, clean up immediately
-            while len(self.cache) > self.maxsize:
-                self.cache.popitem(last=False)  # Remove the least recently used item
-        
-        self.hits = 0
-        self.misses = 0
-    
-    def _cleanup_cache(self):
-        to_remove = max(1, int(len(self.cache) * 0.1))
-        # Remove the least recently used items
-        for _ in range(to_remove):
-            if self.cache:
-                self.cache.popitem(last=False)
-
-get_all_code_objects = AdaptiveCache(initial_size=128)(get_all_code_objects)
-get_line_numbers = AdaptiveCache(initial_size=256)(get_line_numbers)
-get_func_args = AdaptiveCache(initial_size=64)(get_func_args)
-
-
-def call_in_frame(func: Callable, frame: FrameType, **kwargs) -> Any:
+def _call_with_frame_args(
+    func: Callable, func_args: tuple[str, ...], frame: FrameType, kwargs: dict
+) -> Any:
     f_locals = frame.f_locals
-    args = []
-    for arg in get_func_args(func):
+    args: list[Any] = []
+    append = args.append
+    for arg in func_args:
         if arg == "_frame":
             argval = frame
         elif arg == "_retval":
@@ -226,25 +263,68 @@ def call_in_frame(func: Callable, frame: FrameType, **kwargs) -> Any:
             argval = f_locals[arg]
         else:
             raise TypeError(f"Argument '{arg}' not found in frame locals.")
-        args.append(argval)
+        append(argval)
     return func(*args)
 
 
+def _call_without_args(func: Callable, frame: FrameType, kwargs: dict) -> Any:
+    return func()
+
+
+def compile_frame_invoker(func: Callable) -> Callable[[FrameType, dict], Any]:
+    """
+    Resolve the arguments of func once and return invoker(frame, kwargs),
+    which calls func with them taken from the frame: _frame is the frame,
+    _retval is kwargs["retval"] and any other name is a frame local.
+    """
+    func_args = get_func_args(func)
+    if not func_args:
+        # Side-effect callbacks often take no arguments, skip resolving them
+        return functools.partial(_call_without_args, func)
+    return functools.partial(_call_with_frame_args, func, func_args)
+
+
+def call_in_frame(func: Callable, frame: FrameType, **kwargs) -> Any:
+    return compile_frame_invoker(func)(frame, kwargs)
+
+
+# Weak keys so caching a hash does not keep the entity alive. Each hash is
+# stored with the source stamp it was computed from, see _source_stamp
+_source_hash_cache: weakref.WeakKeyDictionary[
+    Any, tuple[tuple[int, int] | None, str]
+] = weakref.WeakKeyDictionary()
+
+
 def get_source_hash(entity: CodeType | FunctionType | MethodType | ModuleType | type):
+    stamp = _source_stamp(entity)
+    cached = _source_hash_cache.get(entity)
+    # The same entity can have new source, e.g. a module after importlib.reload()
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
     import hashlib
-    
+
     try:
         source = inspect.getsource(entity)
-        return hashlib.md5(source.encode("utf-8")).hexdigest()[-8:]
+        # md5 keeps hashes stable for callers that pinned them
+        source_hash = hashlib.md5(
+            source.encode("utf-8"), usedforsecurity=False
+        ).hexdigest()[-8:]
     except OSError:
         # Handle cases where source code is not available (e.g., compiled code)
-        return f"compiled_{id(entity):x}"
+        source_hash = f"compiled_{id(entity):x}"
+
+    _source_hash_cache[entity] = (stamp, source_hash)
+    return source_hash
 
 
 def clear_all() -> None:
     from .instrumenter import Instrumenter
 
     Instrumenter().clear_all()
+    _sourcelines_cache.clear()
     get_all_code_objects.cache_clear()
+    _get_code_lines.cache_clear()
     get_line_numbers.cache_clear()
     get_func_args.cache_clear()
+    _source_hash_cache.clear()
@@ -82,7 +82,9 @@ def test_builder_actions():
     builder = builder.execute("print('action1')")
     builder = builder.execute("print('action2')")
     builder = builder.breakpoint()
-    assert len(builder.actions) == 3
+    builder = builder.jump_to("+1")
+    assert len(builder.actions) == 4
+    assert [action.kind for action in builder.actions] == ["do", "do", "bp", "goto"]
 
 
 def test_builder_condition():
@@ -138,6 +140,16 @@ def test_builder_apply():
     # Test handler functionality
     handler.remove()
 
+    # Test apply with multiple actions
+    def g(x):
+        return x
+
+    builder = instrument(g).at_line("return x").execute("x += 1").execute("x *= 2")
+    handler = builder.apply()
+    assert handler.callbacks == builder.actions
+    assert g(1) == 4
+    handler.remove()
+
 
 def test_builder_context_manager():
     """Test InstrumentBuilder as context manager."""
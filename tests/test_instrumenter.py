@@ -4,6 +4,7 @@
 
 import dis
 import sys
+from unittest.mock import patch
 
 import dowhen
 from dowhen.instrumenter import Instrumenter
@@ -75,6 +76,7 @@ def test_events_on_same_line():
         sys.monitoring.get_local_events(Instrumenter().tool_id, f.__code__)
         == E.NO_EVENTS
     )
+    assert f.__code__ not in Instrumenter()._event_mask
 
 
 def test_line_event_disabled():
@@ -142,3 +144,175 @@ def test_disable_from_condition():
     with disable_coverage():
         f(0)
     assert_instrumented_line_count(f, 0)
+
+
+def test_all_handlers_disabled():
+    def f(x):
+        return x
+
+    handler1 = dowhen.do("x = 1").when(f, "return x")
+    handler2 = dowhen.do("x = 2").when(f, "return x")
+    handler1.disable()
+    handler2.disable()
+
+    with disable_coverage():
+        assert f(0) == 0
+    assert_instrumented_line_count(f, 0)
+
+    handler2.enable()
+    assert f(0) == 2
+
+
+def test_batch_restart_events():
+    def f(x):
+        x += 1
+        return x
+
+    with patch.object(sys.monitoring, "restart_events") as restart_events:
+        with Instrumenter().batch():
+            dowhen.do("x = 1").when(f, "x += 1")
+            dowhen.do("x = 2").when(f, "return x")
+            with Instrumenter().batch():
+                dowhen.do("x = 3").when(f, "<start>")
+            restart_events.assert_not_called()
+        restart_events.assert_called_once()
+
+    assert f(0) == 2
+
+
+def test_global_line_callback():
+    def f(x):
+        return x
+
+    calls = []
+    local_handler = dowhen.do(lambda: calls.append("local")).when(f, "return x")
+    assert not Instrumenter()._has_global_line
+
+    with dowhen.when(None, "return x").do(lambda: calls.append("global")):
+        assert Instrumenter()._has_global_line
+        f(0)
+        assert calls == ["global", "local"]
+
+    assert not Instrumenter()._has_global_line
+    calls.clear()
+    f(0)
+    assert calls == ["local"]
+    local_handler.remove()
+
+
+def test_remove_handler_from_callback():
+    def f(x):
+        return x
+
+    calls = []
+
+    def cb():
+        calls.append("first")
+        handler2.remove()
+
+    handler1 = dowhen.do(cb).when(f, "return x")
+    handler2 = dowhen.do(lambda: calls.append("second")).when(f, "return x")
+
+    f(0)
+    assert calls == ["first"]
+    handler1.remove()
+
+
+def test_paused():
+    def f(x):
+        return x
+
+    events = []
+    handler = dowhen.when(f, "return x").do(lambda: events.append(0))
+    with Instrumenter().paused(f.__code__):
+        f(0)
+    assert events == []
+    f(0)
+    assert events == [0]
+    handler.remove()
+
+    def g(x):
+        return x
+
+    with Instrumenter().paused(g.__code__):
+        assert g(1) == 1
+
+
+def test_paused_nested_and_global():
+    def f(x):
+        def g():
+            return x
+
+        return g()
+
+    g_code = next(c for c in f.__code__.co_consts if isinstance(c, type(f.__code__)))
+    events = []
+    nested = dowhen.when(g_code, "return x").do(lambda: events.append("nested"))
+    global_handler = dowhen.when(None, "<start>").do(
+        lambda _frame: events.append("global") if _frame.f_code is f.__code__ else None
+    )
+    with Instrumenter().paused(f.__code__):
+        f(0)
+    assert events == []
+    f(0)
+    assert events == ["global", "nested"]
+    nested.remove()
+    global_handler.remove()
+
+
+def test_remove_handler_bucket_counts():
+    def f(x):
+        x += 1
+        return x
+
+    instrumenter = Instrumenter()
+    line_handler = dowhen.when(f, "x += 1", "return x").do(lambda: None)
+    start_handler = dowhen.when(f, "<start>").do(lambda: None)
+    assert instrumenter._bucket_counts[f.__code__] == {"line": 2, "start": 1}
+
+    line_handler.remove()
+    assert instrumenter._bucket_counts[f.__code__] == {"start": 1}
+    assert instrumenter._event_mask[f.__code__] == E.PY_START
+
+    start_handler.remove()
+    assert f.__code__ not in instrumenter._bucket_counts
+    assert f.__code__ not in instrumenter._event_mask
+
+
+def test_line_dispatch_update():
+    def f(x):
+        x += 1
+        return x
+
+    instrumenter = Instrumenter()
+    first_line = f.__code__.co_firstlineno
+    h1 = dowhen.when(f, "x += 1").do(lambda: None)
+    table = instrumenter._line_dispatch[f.__code__]
+    h2 = dowhen.when(f, "return x").do(lambda: None)
+    assert instrumenter._line_dispatch[f.__code__] is table
+    assert table == {first_line + 1: (h1,), first_line + 2: (h2,)}
+
+    h1.remove()
+    assert table == {first_line + 2: (h2,)}
+    h2.remove()
+    assert f.__code__ not in instrumenter._line_dispatch
+
+
+def test_duplicate_submit():
+    def f(x):
+        x += 1
+        return x
+
+    calls = []
+    instrumenter = Instrumenter()
+    handler = dowhen.when(f, "return x").do(lambda: calls.append(1))
+    # Buckets are ordered sets, submitting the same handler again is a no-op
+    instrumenter.submit(handler)
+    assert instrumenter._bucket_counts[f.__code__] == {"line": 1}
+    f(0)
+    assert calls == [1]
+
+    handler.remove()
+    assert f.__code__ not in instrumenter._bucket_counts
+    f(0)
+    assert calls == [1]
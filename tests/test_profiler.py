@@ -1,3 +1,4 @@
+import json
 import time
 import tempfile
 import os
@@ -5,7 +6,7 @@ from pathlib import Path
 from types import FunctionType
 from unittest.mock import patch, MagicMock
 import pytest
-from dowhen.profiler import PerformanceProfiler, profile_instrumentation, get_performance_stats
+from dowhen.profiler import _Agg, PerformanceProfiler, PerformanceReport, PerformanceStats, profile_instrumentation, get_performance_stats, is_profiling_active
 
 
 # Test helper function - prefix with underscore to avoid being picked up as test
@@ -29,20 +30,20 @@ class TestPerformanceProfiler:
         profiler = PerformanceProfiler()
         profiler.start_profiling()
         assert profiler._active is True
+        assert is_profiling_active() is True
         profiler.stop_profiling()
         assert profiler._active is False
+        assert is_profiling_active() is False
     
     def test_profiler_clear_stats(self):
         """Test clearing performance statistics."""
         profiler = PerformanceProfiler()
         # Add some dummy data
-        profiler._baseline_data["test"] = [1.0, 2.0, 3.0]
-        profiler._instrumented_data["test"] = [1.5, 2.5, 3.5]
-        profiler._call_counts["test"] = 3
+        profiler._baseline_data["test"] = _Agg(6, 3, 1, 3)
+        profiler._instrumented_data["test"] = _Agg(9, 3, 2, 4)
         profiler.clear_stats()
         assert not profiler._baseline_data
         assert not profiler._instrumented_data
-        assert not profiler._call_counts
     
     def test_profiler_get_code_object(self):
         """Test getting code object from different entity types."""
@@ -138,6 +139,32 @@ class TestPerformanceProfiler:
         profiler.set_default_iterations(0)
         assert profiler.get_default_iterations() != 0  # Should remain unchanged
     
+    def test_profiler_max_tracked_entities(self):
+        """Test that tracked data is capped at the least recently used entries."""
+        profiler = PerformanceProfiler()
+        profiler.clear_stats()
+        original = profiler.get_max_tracked_entities()
+        try:
+            profiler.set_max_tracked_entities(2)
+            assert profiler.get_max_tracked_entities() == 2
+            for key in ("a", "b", "c"):
+                profiler._track(profiler._baseline_data, key, _Agg(1, 1, 1, 1))
+            assert list(profiler._baseline_data) == ["b", "c"]
+            
+            profiler._track(profiler._baseline_data, "b", _Agg(2, 1, 2, 2))
+            profiler._track(profiler._baseline_data, "d", _Agg(1, 1, 1, 1))
+            assert list(profiler._baseline_data) == ["b", "d"]
+            
+            profiler.set_max_tracked_entities(1)
+            assert list(profiler._baseline_data) == ["d"]
+            
+            # Test with invalid value
+            profiler.set_max_tracked_entities(0)
+            assert profiler.get_max_tracked_entities() == 1
+        finally:
+            profiler.set_max_tracked_entities(original)
+            profiler.clear_stats()
+    
     def test_performance_report_to_dict(self):
         """Test converting performance report to dictionary."""
         with profile_instrumentation(_test_function, iterations=10):
@@ -176,6 +203,78 @@ class TestPerformanceProfiler:
         finally:
             os.unlink(temp_file_path)
     
+    def test_performance_report_to_json_orjson(self):
+        """Test that to_json uses orjson when available and indent is 2."""
+        class _FakeOrjson:
+            OPT_INDENT_2 = object()
+            
+            @staticmethod
+            def dumps(obj, option=None):
+                assert option is _FakeOrjson.OPT_INDENT_2
+                return json.dumps(obj, indent=2).encode()
+        
+        # Stats are only reported while profiling is active
+        with profile_instrumentation(_test_function, iterations=10):
+            _test_function(5)
+            report = get_performance_stats()
+        
+        report_dict = report.to_dict()
+        assert report_dict["summary"]["total_calls"] > 0
+        assert report_dict["details"]
+        expected = json.dumps(report_dict, indent=2)
+        
+        with patch('dowhen.profiler.orjson', _FakeOrjson):
+            json_str = report.to_json()
+            assert json_str == expected
+            decoded = json.loads(json_str)
+            assert decoded["summary"] == report_dict["summary"]
+            assert decoded["details"].keys() == report_dict["details"].keys()
+            for key, entity_stats in report_dict["details"].items():
+                assert decoded["details"][key] == entity_stats
+            # Other indents fall back to the stdlib encoder
+            assert report.to_json(indent=4) == json.dumps(report.to_dict(), indent=4)
+            
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = Path(tmpdir) / "report.json"
+                assert report.to_json(path) is None
+                assert path.read_text() == expected
+    
+    def test_profiler_no_iterations(self):
+        """Test that profiling with no iterations reports empty stats."""
+        calls = []
+        
+        def f(x):
+            calls.append(x)
+        
+        with profile_instrumentation(f, iterations=-1):
+            pass
+        
+        assert calls == []
+        profiler = PerformanceProfiler()
+        profiler.start_profiling()
+        try:
+            assert profiler.get_stats(f).call_count == 0
+        finally:
+            profiler.stop_profiling()
+    
+    def test_performance_report_to_json_real_orjson(self):
+        """Test that real orjson output decodes to the report data."""
+        pytest.importorskip("orjson")
+        namespace = {}
+        exec("def f\u00fcnction():\n    pass\n", namespace)
+        code_obj = namespace["f\u00fcnction"].__code__
+        stats = PerformanceStats(0.002, 100, 0.00002, 0.000001, 0.0001, 12.5, 0.0000175)
+        report = PerformanceReport({code_obj: stats})
+        
+        json_str = report.to_json()
+        assert "f\u00fcnction" in json_str
+        assert json.loads(json_str) == report.to_dict()
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "report.json"
+            report.to_json(path)
+            assert json.loads(path.read_text(encoding="utf-8")) == report.to_dict()
+    
     def test_profiler_with_logging(self):
         """Test that profiler uses logging correctly."""
         with patch('dowhen.profiler.logger') as mock_logger:
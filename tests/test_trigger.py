@@ -3,8 +3,12 @@
 
 
 import functools
+import gc
+import importlib
 import re
 import sys
+import weakref
+from unittest.mock import patch
 
 import pytest
 
@@ -28,6 +32,7 @@ def test_event_line_number():
             trigger = dowhen.when(entity, identifier)
             assert trigger.events[0].event_type == "line"
             assert trigger.events[0].event_data["line_number"] == target_line_number
+            assert trigger.events[0].line_number == target_line_number
 
     with pytest.raises(ValueError):
         dowhen.when(f, "nonexistent")
@@ -63,6 +68,7 @@ def test_start_return():
     start_trigger = dowhen.when(f, "<start>")
     assert start_trigger.events[0].event_type == "start"
     assert start_trigger.events[0].event_data == {}
+    assert start_trigger.events[0].line_number is None
     handler = start_trigger.do("x = 1")
     assert f(2) == 1
     handler.remove()
@@ -97,6 +103,17 @@ def test_closure():
     assert f(2) == 1
 
 
+def test_nested_def_line():
+    def f():
+        def g():
+            return 1
+
+        return g()
+
+    trigger = dowhen.when(f, "def g")
+    assert [event.code for event in trigger.events] == [f.__code__]
+
+
 def test_method():
     class A:
         def f(self, x):
@@ -193,6 +210,74 @@ def test_code_without_source():
         assert events == [0]
 
 
+def test_line_number_skips_source():
+    def f(x):
+        return x
+
+    line_number = f.__code__.co_firstlineno + 1
+    dowhen.clear_all()
+    with patch("dowhen.util.getrealsourcelines") as getrealsourcelines:
+        trigger = dowhen.when(f, line_number)
+        getrealsourcelines.assert_not_called()
+    assert [event.line_number for event in trigger.events] == [line_number]
+
+
+def test_getrealsourcelines_cache():
+    from dowhen.util import getrealsourcelines
+
+    def f(x):
+        return x
+
+    source = getrealsourcelines(f)
+    with patch("dowhen.util._getsourcelines") as getsourcelines:
+        assert getrealsourcelines(f) == source
+        getsourcelines.assert_not_called()
+
+    # The cache must not keep the function alive
+    ref = weakref.ref(f)
+    del f
+    gc.collect()
+    assert ref() is None
+
+
+def test_function_without_source():
+    namespace = {}
+    exec(compile("def f(x):\n  return x\n", "<string>", "exec"), namespace)
+    f = namespace["f"]
+    events = []
+    with dowhen.when(f, "+1").do(lambda: events.append(0)):
+        f(0)
+        assert events == [0]
+
+
+def test_nested_code_source_lines():
+    from dowhen.util import getrealsourcelines
+
+    def f():
+        class A:
+            x = 1
+
+        return list(i for i in range(3))
+
+    codes = {
+        c.co_name: c for c in f.__code__.co_consts if isinstance(c, type(f.__code__))
+    }
+    first_line = f.__code__.co_firstlineno
+
+    # Class bodies and generator expressions start at their own first line on
+    # every supported version, not at the enclosing def as 3.12's inspect does
+    lines, start_line = getrealsourcelines(codes["A"])
+    assert start_line == first_line + 1
+    assert [line.strip() for line in lines] == ["class A:", "x = 1"]
+
+    lines, start_line = getrealsourcelines(codes["<genexpr>"])
+    assert start_line == first_line + 4
+    assert [line.strip() for line in lines] == ["return list(i for i in range(3))"]
+
+    trigger = dowhen.when(codes["A"], "+1")
+    assert [event.line_number for event in trigger.events] == [first_line + 2]
+
+
 def test_every_line():
     def f(x):
         x = 1
@@ -320,6 +405,38 @@ def test_source_hash():
         dowhen.when(f, "return x", source_hash=123)
 
 
+def test_source_hash_cache():
+    def f(x):
+        return x
+
+    source_hash = dowhen.get_source_hash(f)
+    with patch("inspect.getsource") as getsource:
+        assert dowhen.get_source_hash(f) == source_hash
+        getsource.assert_not_called()
+
+    # The cache must not keep the function alive
+    ref = weakref.ref(f)
+    del f
+    gc.collect()
+    assert ref() is None
+
+
+def test_source_hash_reload(tmp_path, monkeypatch):
+    module_path = tmp_path / "dowhen_source_hash_mod.py"
+    module_path.write_text("def f():\n    return 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module("dowhen_source_hash_mod")
+    try:
+        source_hash = dowhen.get_source_hash(module)
+        assert dowhen.get_source_hash(module) == source_hash
+
+        module_path.write_text("def f():\n    return 12345\n")
+        importlib.reload(module)
+        assert dowhen.get_source_hash(module) != source_hash
+    finally:
+        sys.modules.pop("dowhen_source_hash_mod", None)
+
+
 def test_should_fire():
     def f(x):
         return x